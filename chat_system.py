@@ -1,13 +1,14 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import streamlit as st
+import atexit
 import json
+import queue
+import random
+import threading
 from pathlib import Path
+from semantic_cache import SemanticCache
 from config import (
     OPENAI_API_KEY,
     OPENAI_MODEL_NAME,
@@ -28,11 +29,121 @@ STRICT_QA_PROMPT = PromptTemplate(
     )
 )
 
+# STRICT_QA_PROMPT only uses plain {placeholders}, so render it with str.format directly
+# instead of going through PromptTemplate's per-call validation and parsing
+_render_qa_prompt = STRICT_QA_PROMPT.template.format
+
+
+# Common greetings and pleasantries are answered from canned replies (no LLM call)
+GREETINGS = frozenset({
+    "hi", "hello", "hey", "good morning", "good afternoon", "good evening"
+})
+
+PLEASANTRIES = frozenset({
+    "ok",
+    "okay",
+    "thanks",
+    "thank you",
+    "thankyou",
+    "thx",
+    "thanks!",
+    "thankyou!",
+    "bye",
+    "goodbye"
+})
+
+GREETING_REPLIES = (
+    "Hello! How can I help with your uploaded documents today?",
+    "Hi there! Ask me anything about your uploaded documents.",
+    "Hey! What would you like to know from your documents?",
+)
+
+PLEASANTRY_REPLIES = (
+    "You're welcome! If you have more questions about your documents, just ask.",
+    "Happy to help! Feel free to ask anything else about your documents.",
+    "Anytime! Let me know if there's anything else you'd like to find in your documents.",
+)
+
+
+# Chat memory is persisted as an append-only JSON Lines log (one message per line)
+MEMORY_FILE = Path("chat_memory.jsonl")
+
+
+def _message_role(message) -> str:
+    if isinstance(message, HumanMessage):
+        return "user"
+    if isinstance(message, AIMessage):
+        return "assistant"
+    return "system"
+
+
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # fall back to the (slower) stdlib encoder
+    def _json_dumps(record) -> bytes:
+        return json.dumps(record, ensure_ascii=False).encode("utf-8")
+
+    _json_loads = json.loads
+
+
+def _encode_message(role: str, content: str) -> bytes:
+    return _json_dumps({"role": role, "content": content}) + b"\n"
+
+
+# Disk writes for the memory log happen on a background thread; the request path only
+# enqueues ("append", (role, content)) or ("rewrite", [(role, content), ...]) operations.
+_persist_queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+
+
+def _persist_worker():
+    """Apply queued memory-log writes in order."""
+    log = None
+    while True:
+        op, payload = _persist_queue.get()
+        try:
+            if op == "rewrite":
+                if log is not None:
+                    log.close()
+                    log = None
+                with MEMORY_FILE.open("wb") as f:
+                    f.writelines(_encode_message(role, content) for role, content in payload)
+            else:
+                if log is None:
+                    log = MEMORY_FILE.open("ab")
+                log.write(_encode_message(*payload))
+                log.flush()
+        except Exception:
+            log = None
+        finally:
+            _persist_queue.task_done()
+
+
+threading.Thread(target=_persist_worker, name="chat-memory-writer", daemon=True).start()
+# Don't lose queued messages when the process exits
+atexit.register(_persist_queue.join)
+
+
+# Memory used to be saved as a single JSON array; it is converted to the log once
+LEGACY_MEMORY_FILE = Path("chat_memory.json")
 
-# ✅ Small wrapper to make memory compatible with RunnableWithMessageHistory
+
+def _import_legacy_memory():
+    """Write the messages of a legacy chat_memory.json into the JSONL log."""
+    with LEGACY_MEMORY_FILE.open("rb") as f:
+        saved = _json_loads(f.read())
+    _persist_queue.put_nowait(("rewrite", [(item.get("role"), item.get("content", "")) for item in saved]))
+    _persist_queue.join()
+
+
+# ✅ Small wrapper that persists every message added to memory
 class MemoryWrapper:
     def __init__(self, memory):
         self.memory = memory
+        # Bumped on every mutation so readers can cache views of the messages
+        self.version = 0
 
     @property
     def messages(self):
@@ -42,52 +153,111 @@ class MemoryWrapper:
     def add_message(self, message):
         # Add messages correctly to the wrapped memory
         self.memory.chat_memory.add_message(message)
-        # Persist full chat to disk after every new message
-        try:
-            mem_file = Path("chat_memory.json")
-            msgs = []
-            for m in self.memory.chat_memory.messages:
-                if isinstance(m, HumanMessage):
-                    role = "user"
-                elif isinstance(m, AIMessage):
-                    role = "assistant"
-                else:
-                    role = "system"
-                msgs.append({"role": role, "content": m.content})
-            with mem_file.open("w", encoding="utf-8") as f:
-                json.dump(msgs, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
+        # Keep the in-process history to the memory window (k turns = 2k messages);
+        # older turns remain in the on-disk log
+        messages = self.memory.chat_memory.messages
+        overflow = len(messages) - 2 * self.memory.k
+        if overflow > 0:
+            del messages[:overflow]
+        self.version += 1
+        # Append only the new message to the on-disk log (written in the background)
+        _persist_queue.put_nowait(("append", (_message_role(message), message.content)))
 
     def add_messages(self, messages):
-        # RunnableWithMessageHistory may call add_messages; forward to underlying memory
+        # Record a whole turn (user question + answer) in one call
         for message in messages:
             self.add_message(message)
 
+    def clear(self):
+        """Drop all messages from memory and from the on-disk log."""
+        self.memory.clear()
+        self.version += 1
+        self.compact()
+
+    def compact(self):
+        """Rewrite the log so it holds exactly the messages currently in memory."""
+        snapshot = [(_message_role(m), m.content) for m in self.memory.chat_memory.messages]
+        _persist_queue.put_nowait(("rewrite", snapshot))
+
+
+# Minimum amount of retrieved text needed before we let the LLM answer
+MIN_RELEVANT_CHARS = 50
+
+
+def _has_enough_content(docs, min_chars: int = MIN_RELEVANT_CHARS) -> bool:
+    """Check that the docs hold at least `min_chars` of text, stopping as soon as they do."""
+    total = 0
+    for d in docs:
+        total += len((d.page_content or "").strip())
+        if total >= min_chars:
+            return True
+    return False
+
+
+# Words that make a question lean on the previous turns ("what about it?", "are you sure?")
+FOLLOW_UP_WORDS = frozenset({
+    "it", "its", "they", "them", "their", "this", "that", "these", "those",
+    "he", "she", "him", "her", "his", "above", "previous", "earlier", "again",
+    "sure", "more", "else", "also", "why", "elaborate", "explain"
+})
+
+
+def _is_follow_up(question: str) -> bool:
+    """Guess whether a question only makes sense together with the conversation so far."""
+    words = [w.strip("?!.,;:'\"") for w in question.lower().split()]
+    return len(words) <= 3 or any(w in FOLLOW_UP_WORDS for w in words)
+
+
+def _preview(content: str, limit: int = 200) -> str:
+    """Truncate content to `limit` characters, marking the cut with an ellipsis."""
+    return content[:limit] + "..." if len(content) > limit else content
+
+
+@st.cache_resource
+def _get_llm():
+    """One ChatOpenAI client, and its keep-alive connection pool, shared by every ChatSystem."""
+    # Imported lazily: langchain_openai pulls in openai, httpx and pydantic models
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        openai_api_key=OPENAI_API_KEY,
+        model_name=OPENAI_MODEL_NAME,
+        temperature=OPENAI_TEMPERATURE,
+        max_tokens=1000,
+        http_client=httpx.Client(
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60.0)
+        )
+    )
+
 
 class ChatSystem:
     def __init__(self, vector_store):
         self.vector_store = vector_store
-        self.llm = ChatOpenAI(
-            openai_api_key=OPENAI_API_KEY,
-            model_name=OPENAI_MODEL_NAME,
-            temperature=OPENAI_TEMPERATURE,
-            max_tokens=1000
-        )
+        self._query_cache = SemanticCache()
+        self._cache_revision = vector_store.revision
+        self.llm = _get_llm()
 
         # Initialize memory
-        self.memory = ConversationBufferMemory(
+        from langchain.memory import ConversationBufferWindowMemory
+
+        self.memory = ConversationBufferWindowMemory(
+            k=MAX_MEMORY_HISTORY,
             memory_key="chat_history",
             return_messages=True
         )
 
         # Load persisted memory from disk (if present)
         try:
-            mem_file = Path("chat_memory.json")
-            if mem_file.exists():
-                with mem_file.open("r", encoding="utf-8") as f:
-                    saved = json.load(f)
-                for item in saved:
+            # Let pending background writes land before reading the log
+            _persist_queue.join()
+            if not MEMORY_FILE.exists() and LEGACY_MEMORY_FILE.exists():
+                _import_legacy_memory()
+            if MEMORY_FILE.exists():
+                with MEMORY_FILE.open("rb") as f:
+                    saved = [_json_loads(line) for line in f if line.strip()]
+                # Only the last MAX_MEMORY_HISTORY turns are kept in memory; the log keeps everything
+                for item in saved[-2 * MAX_MEMORY_HISTORY:]:
                     role = item.get("role")
                     content = item.get("content", "")
                     if role == "user":
@@ -98,152 +268,173 @@ class ChatSystem:
             # ignore load errors and continue with empty memory
             pass
 
-        # Initialize conversation chain
-        self.conversation_chain = None
-        self._initialize_conversation_chain()
+        # (query, store revision, query embedding, unscoped docs or None) of the last chat turn,
+        # reused by get_context_info so the same question is never embedded twice
+        self._last_query: Optional[Tuple[str, int, List[float], Optional[list]]] = None
+
+        # Wrap memory so every turn is also persisted to disk
+        self._history = MemoryWrapper(self.memory)
+        self._history_cache: Optional[Tuple[int, List[Dict[str, str]]]] = None
+        self._initialize_vectorstore()
 
-    def _initialize_conversation_chain(self):
-        """Initialize the conversational retrieval chain."""
+    def _initialize_vectorstore(self) -> bool:
+        """Make sure the vector store is ready for retrieval."""
         try:
             print("🔄 Checking vector store...")
-            if not self.vector_store.vectorstore:
+            if self.vector_store.vectorstore is None:
                 print("❌ Vector store not initialized - trying to initialize...")
                 if not self.vector_store.initialize_vectorstore():
                     print("❌ Failed to initialize vector store")
-                    return
-
-            print("🔄 Initializing conversation chain...")
-            base_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=self.vector_store.vectorstore.as_retriever(
-                    search_kwargs={"k": MAX_CONTEXT_CHUNKS}
-                ),
-                return_source_documents=True,
-                verbose=False
-            )
+                    return False
+
+            print("✅ Chat system initialized successfully")
+            return True
+
+        except Exception as e:
+            print(f"❌ Error initializing chat system: {str(e)}")
+            st.error(f"Error initializing chat system: {str(e)}")
+            return False
+
+    def _search(self, embedding: List[float], source_filter: Optional[str] = None) -> list:
+        """Nearest chunks to an already computed query embedding, optionally scoped to one upload."""
+        vectorstore = self.vector_store.vectorstore
+        if source_filter is None:
+            return vectorstore.similarity_search_by_vector(embedding, k=MAX_CONTEXT_CHUNKS)
+        # Let Chroma apply the filter so the k nearest neighbours all match the scope
+        return vectorstore.similarity_search_by_vector(
+            embedding,
+            k=MAX_CONTEXT_CHUNKS,
+            filter={"$or": [{"upload_id": source_filter}, {"source": source_filter}]}
+        )
+
+    def _prepare_answer(self, user_input: str, source_filter: str = None):
+        """Run everything that happens before generation.
 
-            # ✅ Wrap memory with a compatibility layer
-            wrapped_memory = MemoryWrapper(self.memory)
+        Returns either a finished result dict (not initialized, pleasantry, cache hit,
+        refusal) or a ``(messages, retrieved_docs, query_vec)`` tuple for the LLM.
+        """
+        if self.vector_store.vectorstore is None:
+            return {
+                "response": "Sorry, the chat system is not properly initialized. Please check your configuration.",
+                "source_documents": [],
+                "error": "Chat system not initialized"
+            }
 
-            self.conversation_chain = RunnableWithMessageHistory(
-                base_chain,
-                lambda session_id: wrapped_memory,  # use wrapped memory
-                input_messages_key="question",
-                history_messages_key="chat_history",
-                output_messages_key="answer",  # ✅ fix for multiple output keys
+        # Quick pre-filter: ignore short pleasantries/acknowledgements
+        try:
+            plain = (user_input or "").strip().lower()
+        except Exception:
+            plain = ""
+
+        # If the user greets, reply politely (skip retrieval/QA)
+        if plain in GREETINGS:
+            return {"response": random.choice(GREETING_REPLIES), "source_documents": [], "error": None}
+
+        # If it's a simple acknowledgement/pleasantry, acknowledge politely
+        if plain in PLEASANTRIES or len(plain) <= 2:
+            return {"response": random.choice(PLEASANTRY_REPLIES), "source_documents": [], "error": None}
+
+        # Semantic cache: a repeated or paraphrased question reuses the previous answer
+        # (skips retrieval and the LLM round-trip). Cached answers are dropped whenever
+        # the knowledge base changes.
+        if self._cache_revision != self.vector_store.revision:
+            self._query_cache.clear()
+            self._cache_revision = self.vector_store.revision
+        # Follow-up questions are answered in light of the chat history, so a cached answer
+        # to the same words from another conversation doesn't fit them: skip the cache
+        history = list(self.memory.chat_memory.messages)
+        use_cache = not (history and _is_follow_up(plain))
+        # The query is embedded once here and the same vector drives retrieval below
+        try:
+            query_embedding = self.vector_store.embed_query(user_input)
+            query_vec = SemanticCache.normalize(query_embedding) if use_cache else None
+        except Exception:
+            query_embedding = query_vec = None
+        if query_vec is not None:
+            cached = self._query_cache.lookup(query_vec, source_filter)
+            if cached is not None:
+                response, source_documents = cached
+                self._history.add_messages([HumanMessage(content=user_input), AIMessage(content=response)])
+                return {"response": response, "source_documents": source_documents, "error": None}
+
+        # For debugging & control: perform retrieval first so we can decide to refuse
+        try:
+            # If a source_filter (upload_id or filename) is provided, restrict retrieval to it
+            # Only filter if source_filter is not None (when "All Documents" is selected, source_filter is None)
+            retrieved_docs = self._search(query_embedding, source_filter)
+            if source_filter is not None and not retrieved_docs:
+                # Nothing stored under this scope: fall back to searching all documents
+                # so a stale selection doesn't filter out everything
+                retrieved_docs = self._search(query_embedding)
+            self._last_query = (
+                user_input,
+                self.vector_store.revision,
+                query_embedding,
+                retrieved_docs if source_filter is None else None
             )
+        except Exception:
+            retrieved_docs = []
+
+        # If retrieval returned nothing or content is too small, refuse to answer to avoid hallucination
+        if not _has_enough_content(retrieved_docs):
+            return {
+                "response": "I don't know the answer to that based on the uploaded documents. I can only answer questions supported by the provided documents.",
+                "source_documents": [],
+                "error": None
+            }
 
-            print("✅ Conversation chain initialized successfully")
+        # Answer straight from the docs retrieved above with the strict prompt
+        # (no second retrieval pass and no question-condensing LLM call). The windowed
+        # chat history goes in front so follow-up questions keep their context.
+        context = "\n\n".join(d.page_content for d in retrieved_docs)
+        messages = history + [HumanMessage(content=_render_qa_prompt(context=context, question=user_input))]
+        return messages, retrieved_docs, query_vec
 
-        except Exception as e:
-            print(f"❌ Error initializing conversation chain: {str(e)}")
-            st.error(f"Error initializing conversation chain: {str(e)}")
+    def _record_answer(self, user_input: str, answer: str, retrieved_docs, query_vec, source_filter: str = None):
+        """Persist a generated turn to memory and the semantic cache."""
+        self._history.add_messages([HumanMessage(content=user_input), AIMessage(content=answer)])
+        if query_vec is not None and answer:
+            self._query_cache.add(query_vec, source_filter, (answer, retrieved_docs))
 
     def chat(self, user_input: str, source_filter: str = None) -> Dict[str, Any]:
         """Process user input and return AI response."""
         try:
-            if not self.conversation_chain:
-                return {
-                    "response": "Sorry, the chat system is not properly initialized. Please check your configuration.",
-                    "source_documents": [],
-                    "error": "Chat system not initialized"
-                }
-
-            # Quick pre-filter: ignore short pleasantries/acknowledgements
-            try:
-                plain = (user_input or "").strip().lower()
-            except Exception:
-                plain = ""
-
-            # Common greetings and pleasantries
-            GREETINGS = {
-                "hi", "hello", "hey", "good morning", "good afternoon", "good evening"
+            prepared = self._prepare_answer(user_input, source_filter)
+            if isinstance(prepared, dict):
+                return prepared
+
+            messages, retrieved_docs, query_vec = prepared
+            answer = self.llm.invoke(messages).content
+            self._record_answer(user_input, answer, retrieved_docs, query_vec, source_filter)
+
+            # Return retrieved docs alongside the model answer for easier debugging
+            return {
+                "response": answer,
+                "source_documents": retrieved_docs,
+                "error": None
             }
 
-            PLEASANTRIES = {
-                "ok",
-                "okay",
-                "thanks",
-                "thank you",
-                "thankyou",
-                "thx",
-                "thanks!",
-                "thankyou!",
-                "bye",
-                "goodbye"
+        except Exception as e:
+            return {
+                "response": f"Sorry, I encountered an error: {str(e)}",
+                "source_documents": [],
+                "error": str(e)
             }
 
-            # If the user greets, reply politely (skip retrieval/QA)
-            if plain in GREETINGS:
-                try:
-                    prompt = (
-                        "The user greeted you with: '" + (user_input or "") + "'. "
-                        "Reply briefly and politely in one sentence, and invite them to ask about their uploaded documents."
-                    )
-                    ai_msg = self.llm.invoke([HumanMessage(content=prompt)])
-                    reply = getattr(ai_msg, "content", None) or "Hello! How can I help with your uploaded documents today?"
-                except Exception:
-                    reply = "Hello! How can I help with your uploaded documents today?"
-                return {"response": reply, "source_documents": [], "error": None}
-
-            # If it's a simple acknowledgement/pleasantry, acknowledge politely
-            if plain in PLEASANTRIES or len(plain) <= 2:
-                try:
-                    prompt = (
-                        "The user wrote an acknowledgement: '" + (user_input or "") + "'. "
-                        "Reply with a short friendly acknowledgement (one sentence) and invite them to ask anything about their uploaded documents."
-                    )
-                    ai_msg = self.llm.invoke([HumanMessage(content=prompt)])
-                    reply = getattr(ai_msg, "content", None) or "You're welcome! If you have more questions about your documents, just ask."
-                except Exception:
-                    reply = "You're welcome! If you have more questions about your documents, just ask."
-                return {"response": reply, "source_documents": [], "error": None}
-
-            # For debugging & control: perform retrieval first so we can decide to refuse
-            try:
-                retriever = self.vector_store.vectorstore.as_retriever(search_kwargs={"k": MAX_CONTEXT_CHUNKS})
-                retrieved_docs = retriever.get_relevant_documents(user_input)
-                # If a source_filter (upload_id or filename) is provided, restrict retrieved docs
-                # Only filter if source_filter is not None (when "All Documents" is selected, source_filter is None)
-                if source_filter is not None:
-                    # Prefer upload_id match (new metadata), fallback to filename match
-                    filtered = [d for d in retrieved_docs if (d.metadata or {}).get("upload_id") == source_filter]
-                    if not filtered:
-                        # Fallback: try matching by source filename
-                        filtered = [d for d in retrieved_docs if (d.metadata or {}).get("source") == source_filter]
-                    # Only apply filter if we actually found matching documents
-                    # This prevents filtering out everything when upload_id doesn't exist
-                    if filtered:
-                        retrieved_docs = filtered
-            except Exception:
-                retrieved_docs = []
-
-            # If retrieval returned nothing or content is too small, refuse to answer to avoid hallucination
-            MIN_RELEVANT_CHARS = 50
-            total_chars = sum(len((d.page_content or "").strip()) for d in retrieved_docs)
-            if not retrieved_docs or total_chars < MIN_RELEVANT_CHARS:
-                return {
-                    "response": "I don't know the answer to that based on the uploaded documents. I can only answer questions supported by the provided documents.",
-                    "source_documents": [],
-                    "error": None
-                }
-
-            # Prepend a strict instruction so the LLM uses ONLY the retrieved documents.
-            question_with_instruction = (
-                "Use ONLY the provided retrieved documents to answer the question. "
-                "If the answer cannot be found in those documents, reply exactly: 'I don't know the answer based on the provided documents.' Do not provide any additional information. "
-                f"Question: {user_input}"
-            )
+    def chat_stream(self, user_input: str, source_filter: str = None) -> Dict[str, Any]:
+        """Like chat(), but when the LLM has to answer "response" is an iterator of text chunks.
 
-            result = self.conversation_chain.invoke(
-                {"question": question_with_instruction},
-                config={"configurable": {"session_id": "default_session"}}
-            )
+        The turn is saved to memory once the iterator has been fully consumed.
+        """
+        try:
+            prepared = self._prepare_answer(user_input, source_filter)
+            if isinstance(prepared, dict):
+                return prepared
 
-            # Return retrieved docs alongside the model answer for easier debugging
+            messages, retrieved_docs, query_vec = prepared
             return {
-                "response": result.get("answer"),
-                "source_documents": result.get("source_documents", []) or retrieved_docs,
+                "response": self._stream_answer(user_input, messages, retrieved_docs, query_vec, source_filter),
+                "source_documents": retrieved_docs,
                 "error": None
             }
 
@@ -254,16 +445,32 @@ class ChatSystem:
                 "error": str(e)
             }
 
+    def _stream_answer(self, user_input: str, messages, retrieved_docs, query_vec, source_filter: str = None):
+        """Yield answer chunks from the LLM, then record the full answer."""
+        parts = []
+        try:
+            for chunk in self.llm.stream(messages):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield chunk.content
+        except Exception as e:
+            yield f"Sorry, I encountered an error: {str(e)}"
+            return
+        self._record_answer(user_input, "".join(parts), retrieved_docs, query_vec, source_filter)
+
     def get_chat_history(self) -> List[Dict[str, str]]:
-        """Get the current chat history."""
+        """Get the current chat history (cached until memory changes)."""
         try:
-            history = []
-            for message in self.memory.chat_memory.messages:
-                if isinstance(message, HumanMessage):
-                    history.append({"role": "user", "content": message.content})
-                elif isinstance(message, AIMessage):
-                    history.append({"role": "assistant", "content": message.content})
-            return history
+            version = self._history.version
+            if self._history_cache is None or self._history_cache[0] != version:
+                history = []
+                for message in self.memory.chat_memory.messages:
+                    if isinstance(message, HumanMessage):
+                        history.append({"role": "user", "content": message.content})
+                    elif isinstance(message, AIMessage):
+                        history.append({"role": "assistant", "content": message.content})
+                self._history_cache = (version, history)
+            return self._history_cache[1]
         except Exception as e:
             st.error(f"Error getting chat history: {str(e)}")
             return []
@@ -271,7 +478,7 @@ class ChatSystem:
     def clear_memory(self):
         """Clear the conversation memory."""
         try:
-            self.memory.clear()
+            self._history.clear()
             st.success("Chat memory cleared successfully!")
         except Exception as e:
             st.error(f"Error clearing memory: {str(e)}")
@@ -279,20 +486,25 @@ class ChatSystem:
     def get_context_info(self, query: str) -> Dict[str, Any]:
         """Get context information for a query without generating a response."""
         try:
-            if not self.vector_store.vectorstore:
+            if self.vector_store.vectorstore is None:
                 return {"documents": [], "error": "Vector store not initialized"}
 
-            # Perform similarity search
-            documents = self.vector_store.similarity_search(query, k=MAX_CONTEXT_CHUNKS)
+            # Reuse what chat() already computed for this query: its unscoped docs if the
+            # store hasn't changed, otherwise at least its embedding
+            last = self._last_query
+            if last is not None and last[0] == query:
+                _, revision, embedding, docs = last
+                if docs is not None and revision == self.vector_store.revision:
+                    documents = docs
+                else:
+                    documents = self._search(embedding)
+            else:
+                documents = self.vector_store.similarity_search(query, k=MAX_CONTEXT_CHUNKS)
 
             context_info = {
                 "documents": [
                     {
-                        "content": (
-                            doc.page_content[:200] + "..."
-                            if len(doc.page_content) > 200
-                            else doc.page_content
-                        ),
+                        "content": _preview(doc.page_content),
                         "metadata": doc.metadata,
                         "relevance_score": "N/A"
                     }
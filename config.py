@@ -14,15 +14,37 @@ OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.2"))
 
 # ChromaDB Configuration
 CHROMA_PERSIST_DIRECTORY = "./chroma_db"
+# Documents embedded and written per add batch (50-250 works well)
+VECTOR_STORE_BATCH_SIZE = int(os.getenv("VECTOR_STORE_BATCH_SIZE", "100"))
+# Embedding requests in flight at once, and the OpenAI tokens-per-minute budget they share
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "10"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+# Semantic cache of similarity_search results (dropped whenever documents are added or cleared)
+SEARCH_CACHE_SIMILARITY_THRESHOLD = 0.97
+SEARCH_CACHE_MAX_ENTRIES = 512
 
 # Document Processing Configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 MAX_FILE_SIZE_MB = 50
 
+# Chunk with the compiled semantic-text-splitter when installed (set to false to use LangChain's splitter)
+USE_RUST_SPLITTER = os.getenv("USE_RUST_SPLITTER", "true").lower() in ("1", "true", "yes")
+
+# Uploaded files processed in parallel (fewer may suit spinning disks)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+# Web article fetching: max concurrent downloads, and open connections per host
+WEB_FETCH_CONCURRENCY = int(os.getenv("DOCUCHAT_WEB_CONCURRENCY", "10"))
+WEB_FETCH_PER_HOST_LIMIT = 4
+
 # Chat Configuration
 MAX_MEMORY_HISTORY = 5
 MAX_CONTEXT_CHUNKS = 5
 
+# Semantic answer cache (near-duplicate questions reuse the previous answer)
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 512
+
 # Supported file types
 SUPPORTED_EXTENSIONS = ['.pdf', '.txt', '.md', '.docx']
\ No newline at end of file
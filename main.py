@@ -1,16 +1,20 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import os
-import tempfile
+import csv
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict
 import uuid
-import pandas as pd
 from datetime import datetime
 
 # Import your custom modules
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
 from chat_system import ChatSystem
-from config import SUPPORTED_EXTENSIONS
+from config import SUPPORTED_EXTENSIONS, INGEST_WORKERS
 
 # ---------------------- ⚙️ Page Config ----------------------
 st.set_page_config(
@@ -152,6 +156,85 @@ def initialize_session_state():
         # map display name -> upload_id
         st.session_state.upload_map = {}
 
+MIN_EXTRACTED_CHARS = 50
+
+
+def stream_pdf_upload(document_processor: DocumentProcessor, vector_store: VectorStore, uploaded_file, upload_id: str):
+    """Extract a PDF on a producer thread while the current thread stores finished batches.
+
+    Extraction of later pages overlaps with embedding of earlier ones. The bounded
+    queue keeps the producer at most a few batches ahead. Returns (chunk_count, total_chars, added).
+    """
+    batches = queue.Queue(maxsize=4)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for batch in document_processor.iter_pdf_documents(
+                uploaded_file.getvalue(), filename=uploaded_file.name, upload_id=upload_id
+            ):
+                if stop.is_set():
+                    break
+                batches.put(batch)
+        except Exception as e:
+            batches.put(e)
+        batches.put(done)
+
+    threading.Thread(target=produce, name=f"pdf-extract-{upload_id}", daemon=True).start()
+
+    chunk_count, total_chars, added = 0, 0, True
+    # Hold batches back until the document has proven to contain real text
+    held = []
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            chunk_count += len(batch)
+            total_chars += sum(len((d.page_content or "").strip()) for d in batch)
+            if not added:
+                continue  # a store failed; just drain the producer
+            held.extend(batch)
+            if total_chars >= MIN_EXTRACTED_CHARS:
+                added = vector_store.add_documents(held)
+                held = []
+    finally:
+        # If we stop early, let the producer finish instead of blocking on a full queue
+        stop.set()
+        while True:
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                break
+
+    if chunk_count == 0 or total_chars < MIN_EXTRACTED_CHARS:
+        return chunk_count, total_chars, False
+    return chunk_count, total_chars, added
+
+
+def process_upload(document_processor: DocumentProcessor, vector_store: VectorStore, uploaded_file, upload_id: str):
+    """Extract one uploaded file and add its chunks to the vector store.
+
+    Runs on an ingestion worker thread, so it only touches the objects passed in.
+    Returns (chunk_count, total_chars, added).
+    """
+    if os.path.splitext(uploaded_file.name)[1].lower() == '.pdf':
+        return stream_pdf_upload(document_processor, vector_store, uploaded_file, upload_id)
+
+    # Process uploaded bytes directly (no temp file)
+    docs = document_processor.process_bytes(uploaded_file.getvalue(), uploaded_file.name, upload_id=upload_id)
+
+    # Compute stats for the extracted docs
+    chunk_count = len(docs)
+    total_chars = sum(len((d.page_content or "").strip()) for d in docs)
+    if chunk_count == 0 or total_chars < MIN_EXTRACTED_CHARS:
+        return chunk_count, total_chars, False
+    return chunk_count, total_chars, vector_store.add_documents(docs)
+
+
 def display_chat_message(role: str, content: str, source_docs: List[Dict] = None):
     """Display chat messages with styling."""
     if role == "user":
@@ -182,54 +265,70 @@ def main():
                                           accept_multiple_files=True)
 
         st.markdown('<div class="sidebar-header">🌐 Web Article</div>', unsafe_allow_html=True)
-        web_url = st.text_input("Enter website URL:")
+        web_urls = st.text_area("Enter website URL(s), one per line:")
         if st.button("Process Web Article"):
-            if web_url:
+            urls = web_urls.split()
+            if urls:
                 with st.spinner("🔍 Extracting and embedding content..."):
-                    docs = st.session_state.document_processor.process_web_article(web_url)
+                    # All URLs are downloaded concurrently
+                    docs = st.session_state.document_processor.process_web_articles(urls)
                     if docs and st.session_state.vector_store.add_documents(docs):
-                        st.success(f"✅ Added {len(docs)} chunks from the article.")
+                        st.success(f"✅ Added {len(docs)} chunks from {len(urls)} article(s).")
                     else:
-                        st.error("❌ Could not process this URL.")
+                        st.error("❌ Could not process the URL(s).")
 
         if uploaded_files:
-            for uploaded_file in uploaded_files:
-                if uploaded_file not in st.session_state.uploaded_files:
-                    st.session_state.uploaded_files.append(uploaded_file)
-                    # Process uploaded bytes directly (no temp file)
-                    file_bytes = uploaded_file.getvalue()
-                    ext = os.path.splitext(uploaded_file.name)[1].lower()
-                    # create a stable upload id for this upload
-                    upload_id = f"{uuid.uuid4().hex}_{int(datetime.utcnow().timestamp())}"
-                    with st.spinner(f"📄 Processing {uploaded_file.name}..."):
-                        if ext == '.pdf':
-                            docs = st.session_state.document_processor.process_pdf_bytes(file_bytes, filename=uploaded_file.name, upload_id=upload_id)
-                        elif ext in ['.txt', '.md']:
-                            docs = st.session_state.document_processor.process_text_bytes(file_bytes, filename=uploaded_file.name, upload_id=upload_id)
-                        else:
-                            docs = []
-
-                        # Compute stats for the extracted docs
-                        chunk_count = len(docs)
-                        total_chars = sum(len((d.page_content or "").strip()) for d in docs)
-                        st.session_state.uploaded_file_stats[uploaded_file.name] = {
-                            "chunks": chunk_count,
-                            "total_chars": total_chars
+            new_files = [f for f in uploaded_files if f not in st.session_state.uploaded_files]
+            if new_files:
+                st.session_state.uploaded_files.extend(new_files)
+                # create a stable upload id for each upload and remember the mapping
+                # for UI selection even if extraction fails
+                upload_ids = {
+                    f.name: f"{uuid.uuid4().hex}_{int(datetime.utcnow().timestamp())}"
+                    for f in new_files
+                }
+                st.session_state.upload_map.update(upload_ids)
+
+                # Process files concurrently; workers share this script run's context so
+                # st.* calls made while processing still reach the page
+                ctx = get_script_run_ctx()
+                workers = min(len(new_files), INGEST_WORKERS)
+                with st.spinner(f"📄 Processing {len(new_files)} file(s)..."):
+                    with ThreadPoolExecutor(
+                        max_workers=workers,
+                        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+                    ) as executor:
+                        futures = {
+                            executor.submit(
+                                process_upload,
+                                st.session_state.document_processor,
+                                st.session_state.vector_store,
+                                uploaded_file,
+                                upload_ids[uploaded_file.name]
+                            ): uploaded_file
+                            for uploaded_file in new_files
                         }
+                        for future in as_completed(futures):
+                            uploaded_file = futures[future]
+                            try:
+                                chunk_count, total_chars, added = future.result()
+                            except Exception as e:
+                                st.error(f"❌ Failed to process {uploaded_file.name}: {str(e)}")
+                                continue
 
-                        MIN_EXTRACTED_CHARS = 50
-                        # remember mapping for UI selection even if extraction failed
-                        st.session_state.upload_map[uploaded_file.name] = upload_id
+                            st.session_state.uploaded_file_stats[uploaded_file.name] = {
+                                "chunks": chunk_count,
+                                "total_chars": total_chars
+                            }
 
-                        if chunk_count == 0 or total_chars < MIN_EXTRACTED_CHARS:
-                            # Warn the user: likely scanned PDF or empty document
-                            st.warning(f"⚠️ {uploaded_file.name} does not contain extractable text (found {chunk_count} chunks, {total_chars} chars).\n"
-                                       "Try uploading a text/pdf with selectable text or run OCR on scanned PDFs.")
-                        else:
-                            if st.session_state.vector_store.add_documents(docs):
+                            if chunk_count == 0 or total_chars < MIN_EXTRACTED_CHARS:
+                                # Warn the user: likely scanned PDF or empty document
+                                st.warning(f"⚠️ {uploaded_file.name} does not contain extractable text (found {chunk_count} chunks, {total_chars} chars).\n"
+                                           "Try uploading a text/pdf with selectable text or run OCR on scanned PDFs.")
+                            elif added:
                                 st.success(f"✅ {uploaded_file.name} added successfully!")
                                 # Set the latest uploaded file as the active document scope (by upload_id)
-                                st.session_state.active_document = upload_id
+                                st.session_state.active_document = upload_ids[uploaded_file.name]
                             else:
                                 st.error(f"❌ Failed to process {uploaded_file.name}.")
 
@@ -298,34 +397,43 @@ def main():
 
         with st.spinner("🤔 Thinking..."):
             # Pass active document as a source filter to scope retrieval
-            result = st.session_state.chat_system.chat(user_input, source_filter=st.session_state.active_document)
-            if result["error"]:
-                st.error(result["error"])
-            else:
-                source_docs = [
-                    {"content": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
-                     "metadata": doc.metadata}
-                    for doc in result.get("source_documents", [])
-                ]
-                if source_docs:
-                    st.session_state.source_documents_cache[user_input] = source_docs
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": result["response"],
-                    "source_docs": source_docs,
-                    "timestamp": datetime.now()
-                })
-                display_chat_message("assistant", result["response"], source_docs)
+            result = st.session_state.chat_system.chat_stream(user_input, source_filter=st.session_state.active_document)
+        if result["error"]:
+            st.error(result["error"])
+        else:
+            response = result["response"]
+            if not isinstance(response, str):
+                # Show the answer as it is generated, then re-render it in the chat bubble
+                placeholder = st.empty()
+                with placeholder.container():
+                    response = st.write_stream(response)
+                placeholder.empty()
+            source_docs = [
+                {"content": doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
+                 "metadata": doc.metadata}
+                for doc in result.get("source_documents", [])
+            ]
+            if source_docs:
+                st.session_state.source_documents_cache[user_input] = source_docs
+            st.session_state.chat_history.append({
+                "role": "assistant",
+                "content": response,
+                "source_docs": source_docs,
+                "timestamp": datetime.now()
+            })
+            display_chat_message("assistant", response, source_docs)
 
     # Export Section
     with st.expander("📥 Export Chat or Explore Questions"):
         if st.session_state.chat_history:
-            df = pd.DataFrame([
-                {"Role": m["role"].title(), "Content": m["content"], "Timestamp": m["timestamp"].strftime("%Y-%m-%d %H:%M:%S")}
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            writer.writerow(["Role", "Content", "Timestamp"])
+            writer.writerows(
+                (m["role"].title(), m["content"], m["timestamp"].strftime("%Y-%m-%d %H:%M:%S"))
                 for m in st.session_state.chat_history
-            ])
-            csv = df.to_csv(index=False)
-            st.download_button("⬇️ Download Chat History (CSV)", csv,
+            )
+            st.download_button("⬇️ Download Chat History (CSV)", buf.getvalue(),
                                file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                                mime="text/csv")
 
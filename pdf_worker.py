@@ -0,0 +1,20 @@
+from typing import List
+# Runs in DocumentProcessor's spawned worker processes: only pypdfium2 is imported here,
+# so workers start without loading LangChain, Streamlit or the rest of the app
+import pypdfium2 as pdfium
+
+
+def pdfium_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of the PDF at `path`."""
+    pdf = pdfium.PdfDocument(path)
+    try:
+        texts = []
+        for i in range(start, stop):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return texts
+    finally:
+        pdf.close()
@@ -0,0 +1,79 @@
+import numpy as np
+from typing import Any, Dict, Hashable
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+
+
+class _CacheBucket:
+    """Ring buffer of pre-normalized float32 embeddings and the results stored with them."""
+    __slots__ = ("matrix", "results", "size", "head", "capacity")
+
+    INITIAL_ROWS = 16
+
+    def __init__(self, dim: int, capacity: int):
+        rows = min(self.INITIAL_ROWS, capacity)
+        self.matrix = np.empty((rows, dim), dtype=np.float32)
+        self.results: list = [None] * rows
+        self.size = 0
+        self.head = 0
+        self.capacity = capacity
+
+    def insert(self, vec: np.ndarray, result: Any):
+        rows = self.matrix.shape[0]
+        if self.size == rows and rows < self.capacity:
+            # Grow geometrically up to the cap, then overwrite the oldest row (FIFO)
+            grown = min(rows * 2, self.capacity)
+            matrix = np.empty((grown, self.matrix.shape[1]), dtype=np.float32)
+            matrix[:rows] = self.matrix
+            self.matrix = matrix
+            self.results.extend([None] * (grown - rows))
+            # Nothing has wrapped yet, so the next free row is right after the old ones
+            self.head = rows
+            rows = grown
+        self.matrix[self.head] = vec
+        self.results[self.head] = result
+        self.head = (self.head + 1) % rows
+        self.size = min(self.size + 1, rows)
+
+
+class SemanticCache:
+    """In-process semantic cache: results keyed by normalized query embeddings, matched by cosine similarity."""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # One bucket per partition (e.g. a source filter) so differently scoped queries never collide
+        self._buckets: Dict[Hashable, _CacheBucket] = {}
+
+    @staticmethod
+    def normalize(embedding) -> np.ndarray:
+        vec = np.array(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec /= norm
+        return vec
+
+    def lookup(self, query_vec: np.ndarray, partition: Hashable = None) -> Any:
+        """Return the result cached for the closest query above the threshold, if any."""
+        bucket = self._buckets.get(partition)
+        if bucket is None or bucket.size == 0:
+            return None
+        # Rows are unit length, so one matrix-vector product gives every cosine similarity
+        scores = bucket.matrix[:bucket.size] @ query_vec
+        idx = int(scores.argmax())
+        if scores[idx] >= self.threshold:
+            return bucket.results[idx]
+        return None
+
+    def add(self, query_vec: np.ndarray, partition: Hashable, result: Any):
+        """Store a result, evicting the oldest entry (FIFO) once the cap is reached."""
+        bucket = self._buckets.get(partition)
+        if bucket is None:
+            bucket = _CacheBucket(query_vec.shape[0], self.max_entries)
+            self._buckets[partition] = bucket
+        bucket.insert(query_vec, result)
+
+    def clear(self):
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return sum(bucket.size for bucket in self._buckets.values())
@@ -1,18 +1,134 @@
 import os
+import asyncio
+import logging
+import random
+import threading
+import time
+import uuid
 import chromadb
 from chromadb.config import Settings
+from openai import RateLimitError
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import streamlit as st
-import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from semantic_cache import SemanticCache
 from config import (
     OPENAI_API_KEY,
     OPENAI_EMBEDDING_MODEL_NAME,
-    CHROMA_PERSIST_DIRECTORY
+    CHROMA_PERSIST_DIRECTORY,
+    VECTOR_STORE_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_TOKENS_PER_MINUTE,
+    SEARCH_CACHE_SIMILARITY_THRESHOLD,
+    SEARCH_CACHE_MAX_ENTRIES
 )
 
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between add-failure notices shown in the UI (every failure is still logged)
+ADD_ERROR_NOTICE_INTERVAL = 5.0
+
+# Ids deleted per call when clearing, keeping each SQLite statement well under its variable limit
+CLEAR_BATCH_SIZE = 5000
+
+
+# Threads writing add batches at once (more only adds SQLite writer contention)
+ADD_WRITE_WORKERS = 4
+
+# Query embeddings remembered by exact query text
+QUERY_EMBEDDING_CACHE_SIZE = 256
+
+# Fields requested from Chroma for searches (Chroma requires a list here, not a tuple)
+SEARCH_INCLUDE = ["documents", "metadatas"]
+
+
+def _to_documents(texts: List[str], metadatas: List[Optional[dict]]) -> List[Document]:
+    """Build Documents from one row of a Chroma query response."""
+    return [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+
+
+class _EmbeddingScheduler:
+    """Runs embedding requests with bounded concurrency, a tokens-per-minute budget
+    and jittered exponential backoff on OpenAI rate-limit errors."""
+
+    def __init__(self, max_concurrent: int = EMBEDDING_MAX_CONCURRENCY,
+                 tokens_per_minute: int = EMBEDDING_TOKENS_PER_MINUTE, max_attempts: int = 5):
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # Token bucket refilled continuously at tokens_per_minute
+        self._capacity = float(tokens_per_minute)
+        self._available = self._capacity
+        self._refilled_at = time.monotonic()
+        self._bucket_lock = asyncio.Lock()
+
+    async def _take_tokens(self, tokens: float):
+        tokens = min(tokens, self._capacity)
+        async with self._bucket_lock:
+            while True:
+                now = time.monotonic()
+                self._available = min(self._capacity, self._available + (now - self._refilled_at) * self._capacity / 60)
+                self._refilled_at = now
+                if self._available >= tokens:
+                    self._available -= tokens
+                    return
+                await asyncio.sleep((tokens - self._available) * 60 / self._capacity)
+
+    async def run(self, embed, texts: List[str]) -> List[List[float]]:
+        """Call `await embed(texts)` once capacity allows, retrying when rate limited."""
+        # Rough token estimate: ~4 characters per token
+        tokens = sum(len(text) for text in texts) // 4 + 1
+        async with self._semaphore:
+            for attempt in range(1, self.max_attempts + 1):
+                await self._take_tokens(tokens)
+                try:
+                    return await embed(texts)
+                except RateLimitError:
+                    if attempt == self.max_attempts:
+                        raise
+                    await asyncio.sleep(min(60, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+# Every embedding request, from any VectorStore or session, runs on one long-lived loop
+# thread: the async OpenAI client pools connections per event loop, and the scheduler's
+# asyncio primitives and rate budget must belong to a single loop
+_embedding_loop: Optional[asyncio.AbstractEventLoop] = None
+_embedding_loop_lock = threading.Lock()
+_embedding_scheduler: Optional[_EmbeddingScheduler] = None
+
+
+def _get_embedding_loop() -> asyncio.AbstractEventLoop:
+    global _embedding_loop
+    with _embedding_loop_lock:
+        if _embedding_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="embedding-loop", daemon=True).start()
+            _embedding_loop = loop
+        return _embedding_loop
+
+
+def _get_embedding_scheduler() -> _EmbeddingScheduler:
+    # Only ever called on the embedding loop thread, so no locking is needed
+    global _embedding_scheduler
+    if _embedding_scheduler is None:
+        _embedding_scheduler = _EmbeddingScheduler()
+    return _embedding_scheduler
+
+
+# Store revisions by (persist directory, collection): every Streamlit session has its own
+# VectorStore on the same Chroma files, so adds and clears bump one shared counter and
+# each session's caches compare against it
+_revisions: Dict[Tuple[str, str], int] = {}
+_revisions_lock = threading.Lock()
+
+# Collections whose index has been warmed in this process (keyed like _revisions)
+_warmed_collections = set()
+_warmed_collections_lock = threading.Lock()
+
+
 class VectorStore:
     def __init__(self):
         self.embeddings = OpenAIEmbeddings(
@@ -30,7 +146,21 @@ class VectorStore:
         )
         
         self.vectorstore = None
+        # Raw Chroma collection behind self.vectorstore, used for writes with precomputed embeddings
+        self._collection = None
+        self._query = None
         self.collection_name = "knowledge_vault"
+        self._revision_key = (os.path.abspath(CHROMA_PERSIST_DIRECTORY), self.collection_name)
+        # Revision the search cache below was filled at
+        self._search_cache_revision = self.revision
+        self._last_add_error_notice = float("-inf")
+        # Semantic cache of similarity_search results, partitioned by k
+        self._search_cache = SemanticCache(SEARCH_CACHE_SIMILARITY_THRESHOLD, SEARCH_CACHE_MAX_ENTRIES)
+        self._search_cache_lock = threading.RLock()
+        self._search_cache_stats = {"hits": 0, "misses": 0}
+        # Recent query embeddings by exact text; these never go stale, so nothing invalidates them
+        self._query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._query_embedding_lock = threading.Lock()
     
     def initialize_vectorstore(self):
         """Initialize or load the vector store."""
@@ -39,9 +169,16 @@ class VectorStore:
             self.vectorstore = Chroma(
                 client=self.client,
                 collection_name=self.collection_name,
-                embedding_function=self.embeddings,
-                persist_directory=CHROMA_PERSIST_DIRECTORY
+                embedding_function=self.embeddings
             )
+            self._bind_collection(self.vectorstore._collection)
+            # Load the index in the background so the first user query doesn't pay for it;
+            # Chroma shares the loaded index across clients, so once per collection is enough
+            with _warmed_collections_lock:
+                warm = self._revision_key not in _warmed_collections
+                _warmed_collections.add(self._revision_key)
+            if warm:
+                threading.Thread(target=self._warm_index, name="chroma-warmup", daemon=True).start()
             print("✅ Vector store initialized successfully")
             return True
         except Exception as e:
@@ -49,70 +186,293 @@ class VectorStore:
             st.error(f"Error initializing vector store: {str(e)}")
             return False
     
-    def add_documents(self, documents: List[Document]) -> bool:
-        """Add documents to the vector store."""
+    def _bind_collection(self, collection):
+        # Bind collection.query once; every search goes through this method
+        self._collection = collection
+        self._query = collection.query if collection is not None else None
+
+    def _warm_index(self):
+        """Run one query with a stored embedding so Chroma loads its HNSW index from disk now."""
         try:
-            if not self.vectorstore:
-                if not self.initialize_vectorstore():
-                    return False
+            sample = self._collection.get(limit=1, include=["embeddings"])
+            if sample["ids"]:
+                self._collection.query(query_embeddings=[sample["embeddings"][0]], n_results=1, include=[])
+        except Exception:
+            logger.exception("Vector index warmup failed")
 
-            self.vectorstore.add_documents(documents or [])
-            return True
+    def _report_add_error(self, error: Exception, start: int, batch_size: int):
+        # The logging module only formats the traceback if a handler actually emits it
+        logger.error("Error adding documents %d-%d to vector store", start, start + batch_size, exc_info=error)
+        # A failing endpoint fails every batch; show the user one short notice at a time
+        now = time.monotonic()
+        if now - self._last_add_error_notice < ADD_ERROR_NOTICE_INTERVAL:
+            return
+        self._last_add_error_notice = now
+        try:
+            st.error(f"Error adding documents to vector store: {type(error).__name__}: {error}")
         except Exception:
-            tb = traceback.format_exc()
-            print("Error adding documents to vector store:\n", tb)
+            pass
+
+    async def _aembed_batches(self, batches: List[List[Document]]) -> list:
+        """Embed all batches concurrently; a failed batch yields its exception (runs on the embedding loop)."""
+        scheduler = _get_embedding_scheduler()
+        # gather keeps results in batch order however the requests finish
+        return await asyncio.gather(
+            *(
+                scheduler.run(self.embeddings.aembed_documents, [d.page_content for d in batch])
+                for batch in batches
+            ),
+            return_exceptions=True
+        )
+
+    def _add_batch(self, batch: List[Document], embeddings):
+        if isinstance(embeddings, BaseException):
+            raise embeddings
+        # Chroma rejects empty metadata dicts, so as in Chroma.add_texts rows without
+        # metadata are written in a separate call that passes no metadatas
+        with_metadata = [i for i, d in enumerate(batch) if d.metadata]
+        without_metadata = [i for i, d in enumerate(batch) if not d.metadata]
+        for indices, metadatas in (
+            (with_metadata, [batch[i].metadata for i in with_metadata]),
+            (without_metadata, None)
+        ):
+            if indices:
+                self._collection.add(
+                    ids=[str(uuid.uuid4()) for _ in indices],
+                    embeddings=[embeddings[i] for i in indices],
+                    documents=[batch[i].page_content for i in indices],
+                    metadatas=metadatas
+                )
+
+    def _write_batches(self, batches: List[List[Document]], embedded: list) -> List[Tuple[int, Exception]]:
+        """Write embedded batches straight to the collection (Chroma.add_documents would embed them again).
+
+        Batches are written by a few threads so HNSW inserts overlap with SQLite commits.
+        A failed batch is skipped so the remaining batches still get added.
+        Returns the (batch index, error) of every batch that failed.
+        """
+        if not batches:
+            return []
+        with ThreadPoolExecutor(max_workers=min(ADD_WRITE_WORKERS, len(batches))) as executor:
+            futures = [executor.submit(self._add_batch, batch, embeddings) for batch, embeddings in zip(batches, embedded)]
+
+        errors = []
+        for index, future in enumerate(futures):
             try:
-                st.error(f"Error adding documents to vector store: {tb}")
-            except Exception:
-                pass
+                future.result()
+            except Exception as e:
+                errors.append((index, e))
+        if len(errors) < len(batches):
+            self._invalidate_search_cache()
+        return errors
+
+    def _report_add_errors(self, errors: List[Tuple[int, Exception]], batch_size: int) -> bool:
+        """Report failed batches; call on the caller's thread, where st.error can reach the page.
+
+        Returns True only if every batch was added.
+        """
+        for index, error in errors:
+            self._report_add_error(error, index * batch_size, batch_size)
+        return not errors
+
+    def _split_batches(self, documents: List[Document], batch_size: int) -> Optional[List[List[Document]]]:
+        """Split documents into write batches, initializing the store first (None if that fails)."""
+        if self.vectorstore is None:
+            if not self.initialize_vectorstore():
+                return None
+        documents = documents or []
+        return [documents[start:start + batch_size] for start in range(0, len(documents), batch_size)]
+
+    async def aadd_documents(self, documents: List[Document], batch_size: int = VECTOR_STORE_BATCH_SIZE) -> bool:
+        """Async add_documents for callers already running an event loop."""
+        batches = self._split_batches(documents, batch_size)
+        if batches is None:
+            return False
+        # Embed on the shared embedding loop whichever loop the caller awaits from
+        embedded = await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._aembed_batches(batches), _get_embedding_loop())
+        )
+        # Blocking writes go to an executor; errors are reported back on the caller's thread
+        errors = await asyncio.get_running_loop().run_in_executor(None, self._write_batches, batches, embedded)
+        return self._report_add_errors(errors, batch_size)
+
+    def add_documents(self, documents: List[Document], batch_size: int = VECTOR_STORE_BATCH_SIZE) -> bool:
+        """Add documents to the vector store, embedding the batches concurrently."""
+        batches = self._split_batches(documents, batch_size)
+        if batches is None:
             return False
+        embedded = asyncio.run_coroutine_threadsafe(self._aembed_batches(batches), _get_embedding_loop()).result()
+        return self._report_add_errors(self._write_batches(batches, embedded), batch_size)
+
+    @property
+    def revision(self) -> int:
+        """Bumped whenever the stored documents change (in any session) so callers can drop stale caches."""
+        return _revisions.get(self._revision_key, 0)
+
+    def _invalidate_search_cache(self):
+        with _revisions_lock:
+            _revisions[self._revision_key] = self.revision + 1
+        with self._search_cache_lock:
+            self._sync_search_cache()
+
+    def _sync_search_cache(self):
+        # Call with _search_cache_lock held: drop results cached before the latest change
+        revision = self.revision
+        if self._search_cache_revision != revision:
+            self._search_cache.clear()
+            self._search_cache_revision = revision
+
+    def get_cache_stats(self) -> dict:
+        """Get hit/miss counters and the current size of the search cache."""
+        with self._search_cache_lock:
+            return {**self._search_cache_stats, "size": len(self._search_cache)}
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the embedding if the same text was embedded recently."""
+        with self._query_embedding_lock:
+            embedding = self._query_embeddings.get(query)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(query)
+                return embedding
+        embedding = self.embeddings.embed_query(query)
+        self._remember_query_embeddings({query: embedding})
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries, sending only the ones not embedded recently in a single request."""
+        with self._query_embedding_lock:
+            known = {query: self._query_embeddings[query] for query in queries if query in self._query_embeddings}
+        missing = [query for query in dict.fromkeys(queries) if query not in known]
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            self._remember_query_embeddings(fresh)
+            known.update(fresh)
+        return [known[query] for query in queries]
+
+    def _remember_query_embeddings(self, embeddings: dict):
+        with self._query_embedding_lock:
+            for query, embedding in embeddings.items():
+                self._query_embeddings[query] = embedding
+                self._query_embeddings.move_to_end(query)
+            while len(self._query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
 
     def similarity_search(self, query: str, k: int = 5) -> List[Document]:
         """Perform similarity search and return relevant documents."""
         try:
-            if not self.vectorstore:
+            if self.vectorstore is None:
                 if not self.initialize_vectorstore():
                     return []
             
+            # Paraphrases of a recent query reuse its results: one in-memory dot product
+            # against the cached query embeddings instead of a Chroma search
+            revision = self.revision
+            embedding = self.embed_query(query)
+            query_vec = SemanticCache.normalize(embedding)
+            with self._search_cache_lock:
+                self._sync_search_cache()
+                cached = self._search_cache.lookup(query_vec, k)
+                self._search_cache_stats["hits" if cached is not None else "misses"] += 1
+            if cached is not None:
+                # Cached as an immutable tuple of shared Documents; callers get their own list
+                return list(cached)
+
             # Perform similarity search
-            results = self.vectorstore.similarity_search(query, k=k)
+            response = self._query(query_embeddings=[embedding], n_results=k, include=SEARCH_INCLUDE)
+            results = _to_documents(response["documents"][0], response["metadatas"][0])
+            with self._search_cache_lock:
+                # Skip results computed against documents that have changed since
+                if revision == self.revision:
+                    self._search_cache.add(query_vec, k, tuple(results))
             return results
             
-        except Exception as e:
-            st.error(f"Error performing similarity search: {str(e)}")
+        except Exception:
+            # Logged rather than shown: this runs on hot and background paths; callers decide what to surface
+            logger.exception("Error performing similarity search")
             return []
     
+    def similarity_search_batch(self, queries: List[str], k: int = 5) -> List[List[Document]]:
+        """Search several queries with one embedding request and one Chroma query.
+
+        Returns one result list per query, in the same order.
+        """
+        try:
+            if self.vectorstore is None:
+                if not self.initialize_vectorstore():
+                    return [[] for _ in queries]
+            if not queries:
+                return []
+
+            revision = self.revision
+            embeddings = self.embed_queries(queries)
+            query_vecs = [SemanticCache.normalize(embedding) for embedding in embeddings]
+            results: List[Optional[List[Document]]] = [None] * len(queries)
+            with self._search_cache_lock:
+                self._sync_search_cache()
+                for i, query_vec in enumerate(query_vecs):
+                    cached = self._search_cache.lookup(query_vec, k)
+                    self._search_cache_stats["hits" if cached is not None else "misses"] += 1
+                    if cached is not None:
+                        results[i] = list(cached)
+
+            misses = [i for i, cached in enumerate(results) if cached is None]
+            if misses:
+                response = self._query(
+                    query_embeddings=[embeddings[i] for i in misses],
+                    n_results=k,
+                    include=SEARCH_INCLUDE
+                )
+                with self._search_cache_lock:
+                    for row, i in enumerate(misses):
+                        results[i] = _to_documents(response["documents"][row], response["metadatas"][row])
+                        # Skip results computed against documents that have changed since
+                        if revision == self.revision:
+                            self._search_cache.add(query_vecs[i], k, tuple(results[i]))
+            return results
+
+        except Exception:
+            logger.exception("Error performing batch similarity search")
+            return [[] for _ in queries]
+
     def get_collection_info(self) -> dict:
         """Get information about the collection."""
         try:
-            if not self.vectorstore:
+            if self.vectorstore is None:
                 if not self.initialize_vectorstore():
                     return {"count": 0, "error": "Failed to initialize"}
             
-            # Get collection count
-            collection = self.client.get_collection(self.collection_name)
-            count = collection.count()
-            
-            return {"count": count, "error": None}
+            # Count through the cached handle instead of looking the collection up again
+            return {"count": self._collection.count(), "error": None}
             
         except Exception as e:
+            logger.exception("Error getting collection info")
             return {"count": 0, "error": str(e)}
     
     def clear_collection(self) -> bool:
         """Clear all documents from the collection."""
         try:
-            if not self.vectorstore:
+            if self.vectorstore is None:
                 if not self.initialize_vectorstore():
                     return False
             
-            # Delete the collection and recreate it
-            self.client.delete_collection(self.collection_name)
-            self.vectorstore = Chroma(
-                client=self.client,
-                collection_name=self.collection_name,
-                embedding_function=self.embeddings,
-                persist_directory=CHROMA_PERSIST_DIRECTORY
-            )
+            try:
+                # Delete the contents but keep the collection, its index files and our handles
+                ids = self._collection.get(include=[])["ids"]
+                for start in range(0, len(ids), CLEAR_BATCH_SIZE):
+                    self._collection.delete(ids=ids[start:start + CLEAR_BATCH_SIZE])
+            except Exception as e:
+                print(f"Clearing by id failed ({str(e)}), recreating the collection")
+                # Delete the collection and recreate it, swapping the new one into the
+                # existing wrapper rather than building another Chroma instance
+                self._bind_collection(None)
+                self.client.delete_collection(self.collection_name)
+                # embedding_function=None as in Chroma's own setup: we always pass embeddings in
+                self._bind_collection(self.client.get_or_create_collection(
+                    name=self.collection_name,
+                    embedding_function=None
+                ))
+                self.vectorstore._collection = self._collection
+            self._invalidate_search_cache()
             return True
             
         except Exception as e: